@@ -1,15 +1,29 @@
 from fastapi import FastAPI, Query, Request
 from utils.rag_helper import get_relevant_chunks
-from typing import Dict, Any
+from utils.session_store import EXHAUSTED, CacheKey, MemorySessionStore, Session, create_session_store
+from contextlib import asynccontextmanager
+from typing import Dict
+import asyncio
 import random
+import sys
 
 # ---------------------------------------------------
 # 🚀 FastAPI App Initialization
 # ---------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the configured session store on startup and close it on shutdown."""
+    global session_store
+    session_store = create_session_store()
+    yield
+    await session_store.close()
+
+
 app = FastAPI(
     title="MCP NotesHub Server",
     description="Backend for contextual note retrieval and quiz generation.",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 
@@ -71,76 +85,144 @@ async def mcp_endpoint(request: Request):
 # ---------------------------------------------------
 # 🧠 Global Cache
 # ---------------------------------------------------
-# Stores active sessions in memory
-# Structure:
-# {
-#   "cache_id": {
-#       "file": str or None,
-#       "topic": str or None,
-#       "chunks": [str],
-#       "served": set()
-#   }
-# }
-chunk_cache: Dict[str, Dict[str, Any]] = {}
+# Active sessions live in session_store: in memory by default,
+# or in Redis (shared by all workers) when REDIS_URL is set.
+# Replaced by the configured store on startup.
+session_store = MemorySessionStore()
+
+# Seconds a query that produced no chunks is answered from cache
+# without re-running the RAG pipeline
+EMPTY_RESULT_TTL = 30
+
+# Builds currently running in this process, keyed by cache id.
+# Only touched from the event loop, so it needs no lock.
+_inflight: Dict[CacheKey, asyncio.Future] = {}
+
+
+def _cache_key(file: str | None, topic: str | None) -> CacheKey:
+    """
+    Cache key for a query: a (file, topic) tuple with None for missing parts.
+    Strings are interned so repeated queries hash and compare by identity.
+    """
+    return (sys.intern(file) if file else None, sys.intern(topic) if topic else None)
+
+
+async def _serve_from_cache(cache_key: CacheKey):
+    """
+    Serve a random unused chunk from an existing session.
+    Returns None if no session exists for the key.
+    """
+    served = await session_store.serve(cache_key)
+    if served is None:
+        # A recent build for this query found nothing → don't rebuild yet
+        empty = await session_store.get_empty(cache_key)
+        if empty is not None:
+            return {"message": "⚠️ No relevant chunks found.", "mode": empty.mode}
+        return None
+
+    # If no remaining chunks → cache was cleared
+    if served is EXHAUSTED:
+        return {"message": "🧹 All chunks served. Cache cleared."}
+
+    return {
+        "mode": served.mode,
+        "file": served.file,
+        "topic": served.topic,
+        "chunk_index": served.chunk_index + 1,
+        "chunk": served.chunk,
+        "remaining": served.remaining,
+        "message": "✅ Served from cache."
+    }
 
 
 # ---------------------------------------------------
 # 🔹 1. Get or Create Chunk Session
 # ---------------------------------------------------
 @app.get("/tools/query")
-def get_chunk(
+async def get_chunk(
     file: str | None = Query(None, description="Name of the note file (optional)"),
     topic: str | None = Query(None, description="Topic keyword to query (optional)")
 ):
     """
     Retrieve a random chunk from cache if available.
     Otherwise, build chunks using RAG helper and cache them.
+    Concurrent requests for the same uncached query share a single build,
+    also across workers when sessions are stored in Redis.
     """
-    cache_key = f"{file or 'none'}::{topic or 'none'}"
+    cache_key = _cache_key(file, topic)
 
     # 🧠 Step 1: If cache exists, return a random unused chunk
-    if cache_key in chunk_cache:
-        session = chunk_cache[cache_key]
-        remaining = [c for i, c in enumerate(session["chunks"]) if i not in session["served"]]
-
-        # If no remaining chunks → clear cache
-        if not remaining:
-            del chunk_cache[cache_key]
-            return {"message": "🧹 All chunks served. Cache cleared."}
+    served = await _serve_from_cache(cache_key)
+    if served is not None:
+        return served
 
-        # Pick one randomly
-        chunk = random.choice(remaining)
-        chunk_index = session["chunks"].index(chunk)
-        session["served"].add(chunk_index)
-
-        return {
-            "mode": session["mode"],
-            "file": session["file"],
-            "topic": session["topic"],
-            "chunk_index": chunk_index + 1,
-            "chunk": chunk,
-            "remaining": len(remaining) - 1,
-            "message": "✅ Served from cache."
-        }
+    # ⏳ Step 1b: If another request is already building it, wait for that build
+    inflight = _inflight.get(cache_key)
+    if inflight is not None:
+        try:
+            result = await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                raise  # this request itself was cancelled
+            return {"error": "Build for this query was cancelled. Please retry."}
+        except Exception as e:
+            return {"error": str(e)}
+        served = await _serve_from_cache(cache_key)
+        if served is not None:
+            return served
+        return {"message": "⚠️ No relevant chunks found.", "mode": result.get("mode")}
 
     # 🧠 Step 2: If cache doesn’t exist, build it using rag_helper
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = fut
     try:
-        result = get_relevant_chunks(file_name=file, topic=topic)
-        chunks = result.get("context_chunks", [])
-        if not chunks:
-            return {"message": "⚠️ No relevant chunks found.", "mode": result.get("mode")}
+        # Only the holder of the build lock may build and create the session
+        while not await session_store.acquire_build(cache_key):
+            # Another worker is building this session → serve from its result
+            await session_store.wait_for_build(cache_key)
+            served = await _serve_from_cache(cache_key)
+            if served is not None:
+                fut.set_result({})
+                return served
+            # Neither a session nor an empty marker: its build failed → try to build here
 
-        chunk_cache[cache_key] = {
-            "file": file,
-            "topic": topic,
-            "chunks": chunks,
-            "served": set(),
-            "mode": result.get("mode")
-        }
-
-        # Immediately serve the first random chunk
-        first_chunk = random.choice(chunks)
-        chunk_cache[cache_key]["served"].add(chunks.index(first_chunk))
+        try:
+            # Another worker may have finished this session while we took the lock
+            served = await _serve_from_cache(cache_key)
+            if served is not None:
+                fut.set_result({})
+                return served
+
+            result = await asyncio.to_thread(get_relevant_chunks, file_name=file, topic=topic)
+            chunks = result.get("context_chunks", [])
+            if not chunks:
+                await session_store.mark_empty(cache_key, result.get("mode"), EMPTY_RESULT_TTL)
+                fut.set_result(result)
+                return {"message": "⚠️ No relevant chunks found.", "mode": result.get("mode")}
+
+            # Shuffle the serving order once; popping from it is then O(1).
+            # Immediately serve the first random chunk
+            order = list(range(len(chunks)))
+            random.shuffle(order)
+            first_chunk = chunks[order.pop()]
+
+            # Cache must be in place before waiters are woken up
+            session = Session(
+                file=file,
+                topic=topic,
+                mode=result.get("mode"),
+                chunks=chunks,
+                unserved=order
+            )
+            while not await session_store.create(cache_key, session):
+                # Our lock expired mid-build and another worker's session is live → use it
+                served = await _serve_from_cache(cache_key)
+                if served is not None:
+                    fut.set_result(result)
+                    return served
+        finally:
+            await session_store.release_build(cache_key)
+        fut.set_result(result)
 
         return {
             "mode": result.get("mode"),
@@ -152,23 +234,30 @@ def get_chunk(
         }
 
     except Exception as e:
+        if not fut.done():
+            fut.set_exception(e)
+            fut.exception()  # mark as retrieved when nobody is waiting
         return {"error": str(e)}
 
+    finally:
+        _inflight.pop(cache_key, None)
+        if not fut.done():
+            fut.cancel()
+
 
 # ---------------------------------------------------
 # 🔹 2. Manually Clear Cache
 # ---------------------------------------------------
 @app.get("/tools/clear")
-def clear_cache(
+async def clear_cache(
     file: str | None = Query(None, description="Name of the note file (optional)"),
     topic: str | None = Query(None, description="Topic name (optional)")
 ):
     """
     Clear the cache manually for a given file/topic combination.
     """
-    cache_key = f"{file or 'none'}::{topic or 'none'}"
-    if cache_key in chunk_cache:
-        del chunk_cache[cache_key]
+    cache_key = _cache_key(file, topic)
+    if await session_store.delete(cache_key):
         return {"message": f"🧹 Cache cleared for query ({file or '*'}, {topic or '*'})"}
     return {"message": "No cache found to clear."}
 
@@ -177,16 +266,15 @@ def clear_cache(
 # 🔹 3. Stop Session (for quiz termination)
 # ---------------------------------------------------
 @app.get("/tools/stop")
-def stop_session(
+async def stop_session(
     file: str | None = Query(None),
     topic: str | None = Query(None)
 ):
     """
     Stop the current quiz session and clear its cache.
     """
-    cache_key = f"{file or 'none'}::{topic or 'none'}"
-    if cache_key in chunk_cache:
-        del chunk_cache[cache_key]
+    cache_key = _cache_key(file, topic)
+    if await session_store.delete(cache_key):
         return {"message": "🛑 Session stopped and cache cleared."}
     return {"message": "No active session to stop."}
 
@@ -195,25 +283,14 @@ def stop_session(
 # 🔹 4. Debug Cache State
 # ---------------------------------------------------
 @app.get("/tools/status")
-def cache_status():
+async def cache_status():
     """
     Show current cache contents for debugging.
     """
-    if not chunk_cache:
+    summaries = await session_store.summaries()
+    if not summaries:
         return {"cache": "empty"}
-    return {
-        "active_caches": {
-            key: {
-                "mode": data["mode"],
-                "file": data["file"],
-                "topic": data["topic"],
-                "total_chunks": len(data["chunks"]),
-                "served": len(data["served"]),
-                "remaining": len(data["chunks"]) - len(data["served"])
-            }
-            for key, data in chunk_cache.items()
-        }
-    }
+    return {"active_caches": summaries}
 
 
 # ---------------------------------------------------
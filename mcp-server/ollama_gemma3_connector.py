@@ -1,9 +1,20 @@
 import requests
 import json
 
+try:
+    import orjson  # optional, faster parsing of streamed NDJSON lines
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+except ImportError:
+    _loads = json.loads
+    _DecodeError = json.JSONDecodeError
+
+# One keep-alive connection pool for both calls
+session = requests.Session()
+
 # 1️⃣ Get a chunk from your NotesHub FastAPI
 query_url = "http://127.0.0.1:8000/tools/query?topic=Inheritance"
-chunk_resp = requests.get(query_url)
+chunk_resp = session.get(query_url)
 chunk_data = chunk_resp.json()
 
 context = chunk_data.get("chunk", "No chunk found.")
@@ -21,15 +32,16 @@ payload = {
 
 print("\n💬 Gemma 3 Response:\n")
 
-with requests.post(ollama_url, json=payload, stream=True) as resp:
-    for line in resp.iter_lines():
+with session.post(ollama_url, json=payload, stream=True) as resp:
+    # Large reads, raw bytes: both parsers accept bytes directly
+    for line in resp.iter_lines(chunk_size=65536, decode_unicode=False):
         if line:
             try:
-                data = json.loads(line.decode("utf-8"))
+                data = _loads(line)
                 message = data.get("message", {}).get("content")
                 if message:
                     print(message, end="", flush=True)
-            except json.JSONDecodeError:
+            except _DecodeError:
                 pass
 
 print("\n\n✅ Done.")
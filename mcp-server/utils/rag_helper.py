@@ -8,7 +8,12 @@ This version:
 """
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import multiprocessing
 import os
+import threading
 from unstructured.partition.auto import partition
 from unstructured.partition.pdf import partition_pdf
 from unstructured.partition.docx import partition_docx
@@ -16,8 +21,8 @@ from unstructured.partition.text import partition_text
 from unstructured.partition.md import partition_md
 from unstructured.partition.html import partition_html
 
+import chromadb
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
 
@@ -28,7 +33,29 @@ from langchain_huggingface import HuggingFaceEmbeddings
 
 NOTES_DIR = Path(__file__).resolve().parent.parent / "notes"
 VECTOR_DIR = Path(__file__).resolve().parent.parent / "data" / "chroma_store"
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+COLLECTION_NAME = "notes"
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt', '.md', '.html')
+EMBED_BATCH_SIZE = 64
+# Fewer new notes than this are parsed inline: each spawned parser has to
+# import unstructured, chromadb and torch first, which costs more than a few parses
+PARALLEL_PARSE_MIN_FILES = 8
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    """
+    Loads the sentence embedding model on first use.
+    Kept lazy so parser worker processes, which import this module,
+    don't each load their own copy of the model.
+    """
+    return HuggingFaceEmbeddings(
+        model_name="all-MiniLM-L6-v2",
+        encode_kwargs={"batch_size": EMBED_BATCH_SIZE}
+    )
+
+
+# Splitter is stateless once built, so it is shared across calls
+_SPLITTER_LARGE = RecursiveCharacterTextSplitter(chunk_size=2500, chunk_overlap=100)
 
 
 # ---------------------- #
@@ -64,57 +91,241 @@ def safe_partition(file_path: str):
 #   BUILD VECTOR STORE   #
 # ---------------------- #
 
+@lru_cache(maxsize=None)
+def get_collection():
+    """
+    Returns the single "notes" collection of one process-wide
+    chromadb.PersistentClient. Every chunk carries its file name in
+    metadata, so per-file queries are filtered by Chroma.
+    Embeddings are always computed here and passed in explicitly,
+    so the collection has no embedding function of its own.
+    """
+    os.makedirs(VECTOR_DIR, exist_ok=True)
+    client = chromadb.PersistentClient(path=str(VECTOR_DIR))
+    return client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=None)
+
+
+def _embed_query(topic: str):
+    """Embeds a topic once for a direct collection query."""
+    return get_embedding_model().embed_query(topic)
+
+
+# Indexed note versions: file name -> source file mtime
+_indexed: dict[str, float] = {}
+# Serializes (re)indexing so concurrent queries don't interleave delete/add
+_index_lock = threading.Lock()
+
+
+def _is_indexed(file_name: str, mtime: float) -> bool:
+    """Checks memory, then the persisted collection, for this file version."""
+    if _indexed.get(file_name) == mtime:
+        return True
+
+    stored = get_collection().get(
+        where={"file": file_name}, limit=1, include=["metadatas"]
+    )["metadatas"]
+    if stored and stored[0].get("source_mtime") == mtime:
+        _indexed[file_name] = mtime
+        return True
+    return False
+
+
+def _split_file(file_path: Path):
+    """Parses a note file and splits its text into overlapping chunks."""
+    # 1️⃣ Parse text safely
+    elements = safe_partition(str(file_path))
+    text = "\n".join([el.text.strip() for el in elements if getattr(el, "text", None)])
+
+    # 2️⃣ Split text into overlapping chunks
+    return _SPLITTER_LARGE.split_text(text)
+
+
+def _store_chunks(file_name: str, texts, embeddings, mtime: float):
+    """Replaces the stored chunks of one file with pre-embedded ones."""
+    collection = get_collection()
+    collection.delete(where={"file": file_name})
+
+    if texts:
+        collection.add(
+            ids=[f"{file_name}:{i}" for i in range(len(texts))],
+            embeddings=list(embeddings),
+            documents=list(texts),
+            metadatas=[
+                {"file": file_name, "source_mtime": mtime, "chunk_index": i}
+                for i in range(len(texts))
+            ]
+        )
+
+    _indexed[file_name] = mtime
+
+
 def build_vectorstore(file_name: str):
     """
     Extracts text from a given note file, splits it into chunks,
-    and builds a Chroma vectorstore with sentence embeddings.
+    and indexes them with sentence embeddings in the shared collection.
+    Indexing is skipped while the file version (mtime) is unchanged,
+    so notes are never re-parsed or re-embedded needlessly.
     """
     file_path = NOTES_DIR / file_name
     if not file_path.exists():
         raise FileNotFoundError(f"File '{file_name}' not found in {NOTES_DIR}")
 
-    # 1️⃣ Parse text safely
-    elements = safe_partition(str(file_path))
-    text = "\n".join([el.text.strip() for el in elements if getattr(el, "text", None)])
+    mtime = file_path.stat().st_mtime
+    # Fast path without the lock, so cache hits never wait behind a running build
+    if _indexed.get(file_name) != mtime:
+        with _index_lock:
+            if not _is_indexed(file_name, mtime):
+                # 3️⃣ Build and persist embeddings
+                texts = _split_file(file_path)
+                embeddings = get_embedding_model().embed_documents(texts) if texts else []
+                _store_chunks(file_name, texts, embeddings, mtime)
 
-    # 2️⃣ Split text into overlapping chunks
-    splitter = RecursiveCharacterTextSplitter(chunk_size=2500, chunk_overlap=100)
-    docs = splitter.create_documents([text])
+    return get_collection()
 
-    # 3️⃣ Build and persist embeddings
-    os.makedirs(VECTOR_DIR, exist_ok=True)
-    vectorstore = Chroma.from_documents(
-        docs,
-        embedding_model,
-        persist_directory=str(VECTOR_DIR)
+
+@lru_cache(maxsize=None)
+def _get_parse_pool():
+    """
+    Returns the process-wide pool of note parsers, started on first use
+    and reused afterwards. Workers are spawned, never forked: this process
+    runs uvicorn, chromadb and torch threads, and forking it can deadlock
+    the child.
+    """
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn")
     )
 
-    return vectorstore
+
+def index_notes(file_names):
+    """
+    Batch variant of build_vectorstore for many files.
+    Chunks of every new or changed file are embedded in a single
+    embed_documents call. Files that fail to parse are skipped.
+    Returns the names of the files that are indexed.
+    """
+    indexed = []
+    candidates = []  # (file_name, mtime) not known to be indexed in memory
+    stale = []       # (file_name, mtime) that need parsing
+    pending = []     # (file_name, mtime, texts) still to be embedded
+
+    # Fast path without the lock, so cache hits never wait behind a running build
+    for file_name in file_names:
+        try:
+            mtime = (NOTES_DIR / file_name).stat().st_mtime
+        except Exception as e:
+            print(f"⚠️ Skipping {file_name}: {e}")
+            continue
+        if _indexed.get(file_name) == mtime:
+            indexed.append(file_name)
+        else:
+            candidates.append((file_name, mtime))
+
+    if not candidates:
+        return indexed
+
+    with _index_lock:
+        # Re-check: another request may have indexed them while we waited
+        for file_name, mtime in candidates:
+            try:
+                if _is_indexed(file_name, mtime):
+                    indexed.append(file_name)
+                else:
+                    stale.append((file_name, mtime))
+            except Exception as e:
+                print(f"⚠️ Skipping {file_name}: {e}")
+
+        # Parsing is CPU-bound, so many new files are parsed in worker processes.
+        # Embedding stays in this process, where the model is loaded once.
+        if len(stale) >= PARALLEL_PARSE_MIN_FILES:
+            pool = _get_parse_pool()
+            futures = [(name, mtime, pool.submit(_split_file, NOTES_DIR / name)) for name, mtime in stale]
+            for file_name, mtime, future in futures:
+                try:
+                    pending.append((file_name, mtime, future.result()))
+                except BrokenProcessPool as e:
+                    # A crashed worker breaks the whole pool → start a fresh one next time
+                    _get_parse_pool.cache_clear()
+                    print(f"⚠️ Skipping {file_name}: {e}")
+                except Exception as e:
+                    print(f"⚠️ Skipping {file_name}: {e}")
+        else:
+            for file_name, mtime in stale:
+                try:
+                    pending.append((file_name, mtime, _split_file(NOTES_DIR / file_name)))
+                except Exception as e:
+                    print(f"⚠️ Skipping {file_name}: {e}")
+
+        all_texts = [text for _, _, texts in pending for text in texts]
+        all_embeddings = get_embedding_model().embed_documents(all_texts) if all_texts else []
+
+        offset = 0
+        for file_name, mtime, texts in pending:
+            embeddings = all_embeddings[offset:offset + len(texts)]
+            offset += len(texts)
+            _store_chunks(file_name, texts, embeddings, mtime)
+            indexed.append(file_name)
+
+    return indexed
 
 
 # ---------------------- #
 #   CONTEXT RETRIEVAL    #
 # ---------------------- #
-from difflib import SequenceMatcher
-import os
+import numpy as np
+
+
+def _search_notes(topic: str, file_names, n: int):
+    """Top-n chunks for a topic across the given files, in one Chroma query."""
+    res = get_collection().query(
+        query_embeddings=[_embed_query(topic)],
+        n_results=n,
+        where={"file": {"$in": list(file_names)}},
+        include=["documents"]
+    )
+    return res["documents"][0]
+
+
+SIMHASH_BITS = 64
+_SIMHASH_SHIFTS = np.arange(SIMHASH_BITS, dtype=np.uint64)
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash fingerprint of a text chunk.
+    Near-duplicate texts get fingerprints with a small Hamming distance.
+    """
+    tokens = text.lower().split()
+    if not tokens:
+        return 0
+
+    hashes = np.array([hash(tok) for tok in tokens], dtype=np.int64).view(np.uint64)
+    bits = (hashes[:, None] >> _SIMHASH_SHIFTS) & np.uint64(1)
+    # Each token votes +1/-1 per bit; positive totals set the bit
+    positive = bits.sum(axis=0) * 2 > len(tokens)
+    return int.from_bytes(np.packbits(positive, bitorder="little").tobytes(), "little")
 
-def is_similar(a, b, threshold=0.9):
-    """Check if two text chunks are semantically similar."""
-    return SequenceMatcher(None, a, b).ratio() > threshold
 
 def deduplicate_semantic(chunks, threshold=0.9):
-    """Remove near-duplicate chunks using semantic similarity."""
-    unique = []
+    """
+    Remove near-duplicate chunks using SimHash fingerprints.
+    Two chunks are duplicates when their fingerprints differ in at most
+    (1 - threshold) of the bits.
+    """
+    max_distance = round((1 - threshold) * SIMHASH_BITS)
+    unique, signatures = [], []
     for chunk in chunks:
-        if not any(is_similar(chunk, u, threshold) for u in unique):
+        sig = simhash(chunk)
+        if not any((sig ^ u).bit_count() <= max_distance for u in signatures):
             unique.append(chunk)
+            signatures.append(sig)
     return unique
 
 
 def get_relevant_chunks(file_name: str = None, topic: str = None, k: int = 5):
     """
     Adaptive retrieval:
-    - file only  -> contextual chunking of that file
+    - file only  -> all stored chunks of that file, in document order
     - topic only -> search all note files for topic
     - both       -> semantic retrieval on that file for topic
     """
@@ -126,16 +337,14 @@ def get_relevant_chunks(file_name: str = None, topic: str = None, k: int = 5):
     # CASE 1: File only
     # ------------------------------
     if file_name and not topic:
-        file_path = NOTES_DIR / file_name
-        if not file_path.exists():
-            raise FileNotFoundError(f"File '{file_name}' not found in {NOTES_DIR}")
-
-        elements = safe_partition(str(file_path))
-        text = "\n".join([el.text.strip() for el in elements if getattr(el, "text", None)])
-
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
-        docs = splitter.create_documents([text])
-        chunks = [d.page_content.strip() for d in docs if d.page_content.strip()]
+        # Reuse the (cached) vectorstore so chunks match the other modes
+        collection = build_vectorstore(file_name)
+        stored = collection.get(where={"file": file_name}, include=["documents", "metadatas"])
+        ordered = sorted(
+            zip(stored["documents"], stored["metadatas"]),
+            key=lambda pair: (pair[1] or {}).get("chunk_index", 0)
+        )
+        chunks = [doc.strip() for doc, _ in ordered if doc.strip()]
 
         return {
             "mode": "file_only",
@@ -150,19 +359,13 @@ def get_relevant_chunks(file_name: str = None, topic: str = None, k: int = 5):
     # ------------------------------
     elif topic and not file_name:
         all_chunks = []
+        note_files = [f for f in os.listdir(NOTES_DIR) if f.endswith(SUPPORTED_EXTENSIONS)]
+        indexed = index_notes(note_files)
 
-        for file in os.listdir(NOTES_DIR):
-            if not file.endswith(('.pdf', '.docx', '.txt', '.md', '.html')):
-                continue
-            try:
-                vectorstore = build_vectorstore(file)
-                retriever = vectorstore.as_retriever(search_kwargs={"k": k})
-                retrieved_docs = retriever.invoke(topic)
-                all_chunks.extend(
-                    [doc.page_content.strip() for doc in retrieved_docs if doc.page_content.strip()]
-                )
-            except Exception as e:
-                print(f"⚠️ Skipping {file}: {e}")
+        # One ANN query over the whole collection, restricted to current notes
+        if indexed:
+            retrieved = _search_notes(topic, indexed, k * len(indexed))
+            all_chunks = [c.strip() for c in retrieved if c.strip()]
 
         # Simple deduplication
         chunks = list(dict.fromkeys(all_chunks))
@@ -179,11 +382,15 @@ def get_relevant_chunks(file_name: str = None, topic: str = None, k: int = 5):
     # CASE 3: File + Topic
     # ------------------------------
     else:
-        vectorstore = build_vectorstore(file_name)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": k})
-        retrieved_docs = retriever.invoke(topic)
-
-        chunks = [doc.page_content.strip() for doc in retrieved_docs if doc.page_content.strip()]
+        collection = build_vectorstore(file_name)
+        res = collection.query(
+            query_embeddings=[_embed_query(topic)],
+            n_results=k,
+            where={"file": file_name},
+            include=["documents"]
+        )
+
+        chunks = [doc.strip() for doc in res["documents"][0] if doc.strip()]
         chunks = deduplicate_semantic(chunks)
 
         return {
@@ -0,0 +1,373 @@
+# utils/session_store.py
+"""
+Quiz session storage for MCP NotesHub.
+- MemorySessionStore keeps sessions in this process (default).
+- RedisSessionStore shares sessions between all uvicorn workers and
+  across restarts. It is enabled by setting REDIS_URL.
+"""
+
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import time
+
+
+# ---------------------- #
+#      SESSION TYPES     #
+# ---------------------- #
+
+# (file, topic) of a query; None where the query parameter was not given
+CacheKey = tuple[str | None, str | None]
+
+
+def key_label(key: CacheKey) -> str:
+    """
+    Readable, collision-free string form of a cache key (its JSON encoding),
+    e.g. '["notes.md", null]'. Used to key status listings.
+    """
+    return json.dumps(list(key))
+
+
+def key_id(key: CacheKey) -> str:
+    """Opaque, fixed-length id of a cache key for Redis key names (sha1 of its label)."""
+    return hashlib.sha1(key_label(key).encode("utf-8")).hexdigest()
+
+
+@dataclass(slots=True)
+class Session:
+    file: str | None
+    topic: str | None
+    mode: str | None
+    chunks: list[str]
+    unserved: list[int]  # shuffled indices of chunks not served yet; serve by pop()
+
+
+@dataclass(slots=True)
+class ServedChunk:
+    file: str | None
+    topic: str | None
+    mode: str | None
+    chunk_index: int
+    chunk: str
+    remaining: int
+
+
+@dataclass(slots=True)
+class EmptyResult:
+    mode: str | None
+
+
+# Returned by serve() when a session had no chunks left and was removed
+EXHAUSTED = object()
+
+
+# ---------------------- #
+#      MEMORY STORE      #
+# ---------------------- #
+
+class MemorySessionStore:
+    """
+    In-process store. Sessions are private to one worker.
+    Every method runs on the event loop and never awaits midway, so each
+    call is atomic without a lock.
+    """
+
+    def __init__(self):
+        self._sessions: dict[CacheKey, Session] = {}
+        # Known-empty queries: key -> (expiry on the monotonic clock, mode)
+        self._empty: dict[CacheKey, tuple[float, str | None]] = {}
+
+    async def serve(self, key: CacheKey):
+        """
+        Pop a random unused chunk of a session.
+        Returns None if no session exists, EXHAUSTED if it had no chunks left.
+        """
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        unserved = session.unserved
+
+        if not unserved:
+            del self._sessions[key]
+            return EXHAUSTED
+
+        # Order was shuffled on creation, so popping the end is a random pick
+        chunk_index = unserved.pop()
+        return ServedChunk(
+            file=session.file,
+            topic=session.topic,
+            mode=session.mode,
+            chunk_index=chunk_index,
+            chunk=session.chunks[chunk_index],
+            remaining=len(unserved)
+        )
+
+    async def create(self, key: CacheKey, session: Session) -> bool:
+        """Store a new session. False (and nothing stored) if one already exists."""
+        if key in self._sessions:
+            return False
+        self._sessions[key] = session
+        return True
+
+    async def delete(self, key: CacheKey) -> bool:
+        """Remove a session and any cached empty result for the key."""
+        had_empty = self._empty.pop(key, None) is not None
+        return self._sessions.pop(key, None) is not None or had_empty
+
+    async def mark_empty(self, key: CacheKey, mode: str | None, ttl: float):
+        """Remember for ttl seconds that this query produced no chunks."""
+        now = time.monotonic()
+        # Drop expired markers here too, or one-off empty queries pile up forever
+        for expired in [k for k, (empty_until, _) in self._empty.items() if empty_until <= now]:
+            del self._empty[expired]
+        self._empty[key] = (now + ttl, mode)
+
+    async def get_empty(self, key: CacheKey):
+        """Returns an EmptyResult if the query is known to be empty, else None."""
+        entry = self._empty.get(key)
+        if entry is None:
+            return None
+        empty_until, mode = entry
+        if empty_until <= time.monotonic():
+            del self._empty[key]
+            return None
+        return EmptyResult(mode=mode)
+
+    async def summaries(self) -> dict:
+        return {
+            key_label(key): {
+                "mode": session.mode,
+                "file": session.file,
+                "topic": session.topic,
+                "total_chunks": len(session.chunks),
+                "served": len(session.chunks) - len(session.unserved),
+                "remaining": len(session.unserved)
+            }
+            for key, session in self._sessions.items()
+        }
+
+    # Builds can't race across processes here; in-process callers
+    # already share one build per key.
+    async def acquire_build(self, key: CacheKey) -> bool:
+        return True
+
+    async def wait_for_build(self, key: CacheKey):
+        return None
+
+    async def release_build(self, key: CacheKey):
+        return None
+
+    async def close(self):
+        return None
+
+
+# ---------------------- #
+#      REDIS STORE       #
+# ---------------------- #
+
+class RedisSessionStore:
+    """
+    Redis-backed store shared by every worker.
+    Layout per cache key:
+      mcp:{id}           hash  label, file, topic, mode, total
+      mcp:{id}:chunks    hash  chunk index -> chunk text
+      mcp:{id}:unserved  set   indices not served yet (SPOP in SERVE_SCRIPT)
+      mcp:{id}:building  str   build lock (SET NX EX, random owner token)
+      mcp:{id}:empty     str   mode of a query known to have no chunks (expires)
+    {id} is the key_id of the (file, topic) cache key, so user-supplied
+    names can never collide with another query's keys or sub-keys.
+    mcp:sessions holds the ids of active sessions for status listings.
+    """
+
+    PREFIX = "mcp:"
+    SESSIONS_KEY = "mcp:sessions"
+    BUILD_LOCK_TTL = 300       # seconds a crashed builder can block others
+    BUILD_POLL_INTERVAL = 0.2  # seconds between lock checks while waiting
+    SESSION_TTL = 24 * 3600    # seconds an untouched session is kept
+
+    # Pops one index and reads its chunk, the remaining count and the
+    # metadata in a single atomic step, and refreshes the session's TTL.
+    # Removes a session that has no chunks left. Returns nil when the
+    # session does not exist.
+    # KEYS: meta, unserved, chunks, sessions  ARGV: session id, ttl
+    SERVE_SCRIPT = """
+    local idx = redis.call('SPOP', KEYS[2])
+    if not idx then
+        if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+        redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+        redis.call('SREM', KEYS[4], ARGV[1])
+        return {'exhausted'}
+    end
+    local chunk = redis.call('HGET', KEYS[3], idx)
+    if not chunk then return false end
+    for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[2]) end
+    return {'ok', idx, chunk, redis.call('SCARD', KEYS[2]), redis.call('HGETALL', KEYS[1])}
+    """
+
+    # Stores a new session unless one already exists for the key, so a
+    # builder can never reset a live session's unserved set.
+    # KEYS: meta, chunks, unserved, sessions
+    # ARGV: session id, ttl, label, file, topic, mode, total, <total chunks>, <unserved indices>
+    CREATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+    redis.call('DEL', KEYS[2], KEYS[3])
+    local total = tonumber(ARGV[7])
+    redis.call('HSET', KEYS[1], 'label', ARGV[3], 'file', ARGV[4], 'topic', ARGV[5], 'mode', ARGV[6], 'total', total)
+    for i = 1, total do redis.call('HSET', KEYS[2], i - 1, ARGV[7 + i]) end
+    for i = 8 + total, #ARGV do redis.call('SADD', KEYS[3], ARGV[i]) end
+    for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[2]) end
+    redis.call('SADD', KEYS[4], ARGV[1])
+    return 1
+    """
+
+    # Deletes the build lock only if it still holds our token, so a
+    # builder whose lock expired can't release another worker's lock.
+    # KEYS: lock  ARGV: token
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client):
+        self._redis = client  # redis.asyncio.Redis with decode_responses=True
+        self._serve_script = client.register_script(self.SERVE_SCRIPT)
+        self._create_script = client.register_script(self.CREATE_SCRIPT)
+        self._release_script = client.register_script(self.RELEASE_SCRIPT)
+        # Tokens of build locks held by this process: session id -> token.
+        # In-process builds are single-flighted, so one token per key.
+        self._build_tokens: dict[str, str] = {}
+
+    def _key(self, key: CacheKey, suffix: str = "") -> str:
+        return f"{self.PREFIX}{key_id(key)}{suffix}"
+
+    async def serve(self, key: CacheKey):
+        """
+        Pop a random unused chunk of a session.
+        Returns None if no session exists, EXHAUSTED if it had no chunks left.
+        """
+        reply = await self._serve_script(
+            keys=[self._key(key), self._key(key, ":unserved"), self._key(key, ":chunks"), self.SESSIONS_KEY],
+            args=[key_id(key), self.SESSION_TTL]
+        )
+        if reply is None:
+            return None
+        if reply[0] == "exhausted":
+            return EXHAUSTED
+
+        _, chunk_index, chunk, remaining, meta_pairs = reply
+        meta = dict(zip(meta_pairs[::2], meta_pairs[1::2]))
+        return ServedChunk(
+            file=meta.get("file") or None,
+            topic=meta.get("topic") or None,
+            mode=meta.get("mode") or None,
+            chunk_index=int(chunk_index),
+            chunk=chunk,
+            remaining=remaining
+        )
+
+    async def create(self, key: CacheKey, session: Session) -> bool:
+        """Store a new session. False (and nothing stored) if one already exists."""
+        # The session's keys expire when abandoned; each serve pushes this back
+        created = await self._create_script(
+            keys=[self._key(key), self._key(key, ":chunks"), self._key(key, ":unserved"), self.SESSIONS_KEY],
+            args=[
+                key_id(key), self.SESSION_TTL, key_label(key),
+                session.file or "", session.topic or "", session.mode or "",
+                len(session.chunks), *session.chunks, *session.unserved
+            ]
+        )
+        return bool(created)
+
+    async def delete(self, key: CacheKey) -> bool:
+        """Remove a session and any cached empty result for the key."""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(key))
+            pipe.delete(self._key(key, ":empty"))
+            pipe.delete(self._key(key, ":chunks"), self._key(key, ":unserved"))
+            pipe.srem(self.SESSIONS_KEY, key_id(key))
+            removed, had_empty, _, _ = await pipe.execute()
+        return removed > 0 or had_empty > 0
+
+    async def mark_empty(self, key: CacheKey, mode: str | None, ttl: float):
+        """Remember for ttl seconds that this query produced no chunks."""
+        await self._redis.set(self._key(key, ":empty"), mode or "", ex=max(1, round(ttl)))
+
+    async def get_empty(self, key: CacheKey):
+        """Returns an EmptyResult if the query is known to be empty, else None."""
+        mode = await self._redis.get(self._key(key, ":empty"))
+        if mode is None:
+            return None
+        return EmptyResult(mode=mode or None)
+
+    async def summaries(self) -> dict:
+        ids = sorted(await self._redis.smembers(self.SESSIONS_KEY))
+        if not ids:
+            return {}
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for session_id in ids:
+                pipe.hgetall(f"{self.PREFIX}{session_id}")
+                pipe.scard(f"{self.PREFIX}{session_id}:unserved")
+            replies = await pipe.execute()
+
+        result = {}
+        expired = []
+        for session_id, meta, remaining in zip(ids, replies[::2], replies[1::2]):
+            if not meta:
+                expired.append(session_id)  # expired or removed concurrently
+                continue
+            total = int(meta.get("total", 0))
+            result[meta.get("label")] = {
+                "mode": meta.get("mode") or None,
+                "file": meta.get("file") or None,
+                "topic": meta.get("topic") or None,
+                "total_chunks": total,
+                "served": total - remaining,
+                "remaining": remaining
+            }
+
+        if expired:
+            await self._redis.srem(self.SESSIONS_KEY, *expired)
+        return result
+
+    async def acquire_build(self, key: CacheKey) -> bool:
+        """Take the cross-worker build lock for a key; False if someone holds it."""
+        token = secrets.token_hex(16)
+        acquired = await self._redis.set(
+            self._key(key, ":building"), token, nx=True, ex=self.BUILD_LOCK_TTL
+        )
+        if acquired:
+            self._build_tokens[key_id(key)] = token
+        return bool(acquired)
+
+    async def wait_for_build(self, key: CacheKey):
+        """Wait until the worker holding the build lock releases it."""
+        deadline = time.monotonic() + self.BUILD_LOCK_TTL
+        while time.monotonic() < deadline and await self._redis.exists(self._key(key, ":building")):
+            await asyncio.sleep(self.BUILD_POLL_INTERVAL)
+
+    async def release_build(self, key: CacheKey):
+        token = self._build_tokens.pop(key_id(key), None)
+        if token is not None:
+            await self._release_script(keys=[self._key(key, ":building")], args=[token])
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_session_store():
+    """
+    Returns a RedisSessionStore when REDIS_URL is set,
+    otherwise an in-process MemorySessionStore.
+    """
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return MemorySessionStore()
+
+    import redis.asyncio as aioredis  # optional dependency, only needed with REDIS_URL
+    return RedisSessionStore(aioredis.from_url(redis_url, decode_responses=True))
@@ -2,6 +2,10 @@ from unstructured.partition.auto import partition
 from pathlib import Path
 import re
 
+# Precompiled patterns used per element in extract_chunks
+_LIST_OR_LABEL = re.compile(r"^[-•]|\w+:")
+_STOPWORDS = re.compile(r"\b(is|are|was|were|has|have|can|should|will|be)\b")
+
 def extract_chunks(file_path: str, max_chars: int = 1200):
     """
     Smart context-aware chunker:
@@ -15,7 +19,8 @@ def extract_chunks(file_path: str, max_chars: int = 1200):
 
     elements = partition(file_path)
     chunks = []
-    current_chunk = ""
+    current_parts: list[str] = []  # texts of the chunk being built
+    current_len = 0                # length of "\n".join(current_parts)
     current_type = None
     i = 0
 
@@ -29,7 +34,7 @@ def extract_chunks(file_path: str, max_chars: int = 1200):
         el_type = type(el).__name__
 
         # 🧠 Case 1: Lead-in that ends with ':' — check next elements
-        if re.search(r":$", text.strip()) and len(text.split()) < 30:
+        if text.endswith(":") and len(text.split()) < 30:
             # Look ahead for list items or short related lines
             lookahead_texts = []
             j = i + 1
@@ -46,7 +51,7 @@ def extract_chunks(file_path: str, max_chars: int = 1200):
                     break
 
                 # Include if it's a list item or short colon-style line
-                if nxt_type == "ListItem" or re.match(r"^[-•]|\w+:", nxt_text):
+                if nxt_type == "ListItem" or _LIST_OR_LABEL.match(nxt_text):
                     lookahead_texts.append(nxt_text)
                     j += 1
                     continue
@@ -62,8 +67,8 @@ def extract_chunks(file_path: str, max_chars: int = 1200):
         # 🧩 Detect short fragments (avoid making them standalone)
         is_fragment = (
             len(text.split()) < 8
-            and not re.search(r"[.!?]$", text)
-            and not re.search(r"\b(is|are|was|were|has|have|can|should|will|be)\b", text.lower())
+            and not text.endswith((".", "!", "?"))
+            and not _STOPWORDS.search(text.lower())
         )
         if is_fragment and chunks:
             chunks[-1] += "\n" + text
@@ -72,19 +77,22 @@ def extract_chunks(file_path: str, max_chars: int = 1200):
 
         # 🚧 Split when too large or structural change
         if (
-            len(current_chunk) + len(text) > max_chars
+            current_len + len(text) > max_chars
             or el_type == "Title"
-            or (current_type and el_type != current_type and len(current_chunk) > 0)
+            or (current_type and el_type != current_type and current_len > 0)
         ):
-            chunks.append(current_chunk.strip())
-            current_chunk = ""
+            chunks.append("\n".join(current_parts).strip())
+            current_parts = []
+            current_len = 0
 
-        current_chunk += ("\n" if current_chunk else "") + text
+        current_len += len(text) + (1 if current_parts else 0)
+        current_parts.append(text)
         current_type = el_type
         i += 1
 
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    last_chunk = "\n".join(current_parts).strip()
+    if last_chunk:
+        chunks.append(last_chunk)
 
     # Filter out tiny leftover lines
     chunks = [c for c in chunks if len(c.split()) > 5]